@@ -0,0 +1,48 @@
+# project_root/model_integration/embedding_cache.py
+
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+import numpy as np
+from model_integration.embeddings import EMBEDDING_MODEL_NAME
+
+# On-disk cache of text embeddings so repeated ingestion of the same
+# search snippets skips the encoder forward pass. Keyed by SHA-256 of the
+# model name plus the text; vectors are stored as float32 blobs.
+
+CACHE_PATH = "project_root/model_integration/embedding_cache.sqlite3"
+
+_conn = None
+_conn_lock = threading.Lock()
+
+def _get_conn():
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+            _conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "hash TEXT PRIMARY KEY, vec BLOB NOT NULL)"
+            )
+            _conn.commit()
+        return _conn
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\x00{text}".encode()).hexdigest()
+
+def get(hash_: str) -> Optional[np.ndarray]:
+    row = _get_conn().execute(
+        "SELECT vec FROM embeddings WHERE hash = ?", (hash_,)
+    ).fetchone()
+    if row is None:
+        return None
+    return np.frombuffer(row[0], dtype=np.float32)
+
+def put(hash_: str, vec: np.ndarray):
+    conn = _get_conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+        (hash_, np.asarray(vec, dtype=np.float32).tobytes()),
+    )
+    conn.commit()
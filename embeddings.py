@@ -1,6 +1,15 @@
 # project_root/model_integration/embeddings.py
 # If needed to customize embeddings
+from functools import lru_cache
 from langchain.embeddings import HuggingFaceEmbeddings
 
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+@lru_cache(maxsize=1)
 def get_embeddings():
-    return HuggingFaceEmbeddings()
\ No newline at end of file
+    # Loading the SentenceTransformer model takes seconds and hundreds of MB,
+    # so keep a single instance per process.
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        encode_kwargs={"batch_size": 64, "normalize_embeddings": True},
+    )
@@ -3,15 +3,28 @@
 import os
 import asyncio
 import logging
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain.llms import LlamaCpp
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict
 
 # This wrapper assumes the Qwen2.5-Coder-14B model is locally hosted via LlamaCpp
 # and accessible at the provided gguf file path.
 # Adjust paths and parameters as needed.
-MODEL_PATH = os.getenv("QWEN_MODEL_PATH", "Qwen2.5-Coder-14B-Instruct-Q6_K_L.gguf")
+# Q4_K_M halves per-token memory bandwidth versus Q6_K_L, which is the
+# bottleneck for local decoding, at a small quality cost for codegen.
+MODEL_PATH = os.getenv("QWEN_MODEL_PATH", "Qwen2.5-Coder-14B-Instruct-Q4_K_M.gguf")
+
+# Static prompt prefix kept byte-identical across calls so llama.cpp's
+# prompt cache can reuse the prefilled KV state instead of re-tokenizing
+# and re-prefilling it every time.
+CODE_PROMPT_PREFIX = "Based on the following requirements:\n"
+
+# Prompts arriving close together (e.g. the three codegen calls of one
+# build) are grouped by the batch worker and run back to back, so they
+# share the prompt-cache-warm model without interleaving other work.
+MAX_BATCH = int(os.getenv("LLM_MAX_BATCH", "4"))
+BATCH_WINDOW_SECONDS = 0.01
 
 class MyHostedModel:
     def __init__(self, model_path: str = MODEL_PATH):
@@ -22,39 +35,147 @@ class MyHostedModel:
             n_ctx=4096,
             temperature=0.2,
             top_p=0.9,
-            n_threads=8
+            n_threads=8,
+            n_batch=512,
+            n_gpu_layers=-1,  # offload everything when a GPU build is present
+            use_mmap=True,
+            streaming=True
         )
-    
+        # Dedicated pool for model calls so long inferences don't starve the
+        # default executor shared with subprocess and embedding work. One
+        # worker by default: a single llama.cpp context is not thread-safe,
+        # so raising LLM_POOL_SIZE is only safe with one context per worker.
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("LLM_POOL_SIZE", "1")),
+            thread_name_prefix="llm"
+        )
+        # Cache evaluated prompt states so calls sharing a prefix (the code
+        # prompts differ only after the requirements block) skip prefill.
+        try:
+            from llama_cpp import LlamaRAMCache
+            self.llm.client.set_cache(LlamaRAMCache())
+        except Exception as e:
+            logging.warning(f"llama.cpp prompt cache unavailable: {e}")
+        # A single llama.cpp context is not thread-safe; every call into
+        # self.llm (invoke and stream alike) must hold this lock.
+        self._llm_lock = threading.Lock()
+        # The queue and worker are created lazily because __init__ may run
+        # before an event loop exists (e.g. under Streamlit).
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=32)
+            self._worker = asyncio.get_event_loop().create_task(self._batch_worker())
+
+    async def _batch_worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Collect whatever else arrives within the batching window so
+            # concurrent prompts go to the pool as one wave.
+            deadline = loop.time() + BATCH_WINDOW_SECONDS
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Run the batch sequentially: the model context can only decode
+            # one prompt at a time, so back-to-back dispatch is what keeps
+            # the prompt cache warm without racing the context.
+            for prompt, future in batch:
+                try:
+                    result = await loop.run_in_executor(
+                        self._executor, self._invoke_locked, prompt
+                    )
+                except Exception as e:
+                    # A caller may have been cancelled while waiting (e.g. a
+                    # sibling codegen task failed); resolving its future then
+                    # would raise and kill the worker mid-batch.
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+
+    def _invoke_locked(self, prompt: str) -> str:
+        with self._llm_lock:
+            return self.llm.invoke(prompt)
+
+    async def _invoke(self, prompt: str) -> str:
+        # LlamaCpp is a plain LLM: it takes a prompt string and returns a
+        # string, not chat messages. Calls are funneled through the batch
+        # worker's queue rather than hitting the executor directly.
+        self._ensure_worker()
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((prompt, future))
+        return await future
+
+
     async def generate_requirements(self, user_query: str) -> Dict[str, Any]:
         # Interactively gather requirements (simplified)
         # In practice, you might do multiple turns with the user
         # For demonstration, we assume one turn is enough
-        messages = [
-            HumanMessage(content=user_query)
-        ]
-        response = await asyncio.get_event_loop().run_in_executor(
-            None, self.llm, messages
-        )
+        response = await self._invoke(user_query)
         # Parse response to JSON (assuming model returns JSON)
         # Implement robust error handling
         try:
-            requirements = self._parse_json(response.content)
+            requirements = self._parse_json(response)
         except Exception as e:
             logging.error(f"Error parsing requirements JSON: {e}")
             requirements = {"app_name": "MyApp", "features": ["task_management"]}
         return requirements
     
+    def _code_prompt(self, language: str, requirements: Dict[str, Any]) -> str:
+        # Language-specific text goes after the requirements block so the
+        # three per-build code prompts share the longest possible prefix.
+        return (
+            f"{CODE_PROMPT_PREFIX}"
+            f"{requirements}\n\n"
+            f"Generate {language} code implementing these requirements.\n"
+            f"Provide well-structured and idiomatic code.\n"
+        )
+
     async def generate_code(self, language: str, requirements: Dict[str, Any]) -> str:
-        prompt = f"""
-        Based on the following requirements:
-        {requirements}
+        prompt = self._code_prompt(language, requirements)
+        return await self._invoke(prompt)
 
-        Generate {language} code implementing these requirements.
-        Provide well-structured and idiomatic code.
-        """
-        messages = [HumanMessage(content=prompt)]
-        response = await asyncio.get_event_loop().run_in_executor(None, self.llm, messages)
-        return response.content
+    async def generate_code_stream(self, language: str, requirements: Dict[str, Any]) -> AsyncIterator[str]:
+        # Bridge the synchronous llm.stream iterator to an async generator so
+        # callers can consume tokens as soon as they are produced instead of
+        # waiting for the full completion.
+        prompt = self._code_prompt(language, requirements)
+        loop = asyncio.get_event_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def produce():
+            # Errors must reach the consumer: silently ending the stream
+            # would leave a truncated file on disk and let the build go on.
+            try:
+                # Streaming bypasses the batch queue but must not bypass the
+                # context lock, or concurrent codegen calls would race the
+                # same llama.cpp context.
+                with self._llm_lock:
+                    for chunk in self.llm.stream(prompt):
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        loop.run_in_executor(self._executor, produce)
+        while True:
+            chunk = await queue.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
     
     async def fix_code(self, project_name: str) -> bool:
         # Attempt to fix code errors.
@@ -64,8 +185,7 @@ class MyHostedModel:
         The code in {project_name} has some errors as per test logs.
         Suggest and provide code fixes directly.
         """
-        messages = [HumanMessage(content=fix_prompt)]
-        response = await asyncio.get_event_loop().run_in_executor(None, self.llm, messages)
+        response = await self._invoke(fix_prompt)
         # Implement logic to apply suggested fixes
         # For demonstration, assume fixes are applied successfully
         return True
@@ -1,18 +1,29 @@
 # project_root/orchestrator/orchestrator.py
 
 import os
-import subprocess
 import asyncio
+import hashlib
 import logging
 import json
+import shutil
 from typing import List
 from model_integration.my_model_wrapper import MyHostedModel
 from langchain.utilities import GoogleSearchAPIWrapper
-from model_integration.rag_chain import rag_search_and_store, add_resources_to_store
-from twilio.rest import Client
+from model_integration.rag_chain import rag_search_and_store, add_resources_to_store, make_search_query
+import aiofiles
+import httpx
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Generated code is cached per requirements hash so re-running build_app
+# with an unchanged spec skips model inference and goes straight to
+# lint/test.
+CODE_CACHE_DIR = "project_root/code_cache"
+
+# Shared async HTTP client for Twilio; SMS goes over raw REST calls so the
+# event loop is never blocked on telephony.
+_http_client = httpx.AsyncClient(timeout=10.0)
+
 class AppBuilderOrchestrator:
     def __init__(self):
         self.project_name = ""
@@ -24,20 +35,44 @@ class AppBuilderOrchestrator:
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             google_cse_id=os.getenv("GOOGLE_CSE_ID")
         )
-        self.twilio_client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+        self.twilio_sid = os.getenv("TWILIO_ACCOUNT_SID")
+        self.twilio_token = os.getenv("TWILIO_AUTH_TOKEN")
         self.twilio_from = os.getenv("TWILIO_FROM_NUMBER")
         self.twilio_to = os.getenv("TWILIO_TO_NUMBER")
+        # Strong references to in-flight SMS tasks; the loop only keeps weak
+        # ones, so an unreferenced task can be garbage-collected mid-send.
+        self._sms_tasks = set()
 
     async def send_sms(self, message: str):
-        if self.twilio_client and self.twilio_from and self.twilio_to:
-            self.twilio_client.messages.create(body=message, from_=self.twilio_from, to=self.twilio_to)
+        if not (self.twilio_sid and self.twilio_token and self.twilio_from and self.twilio_to):
+            return
+        try:
+            await _http_client.post(
+                f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_sid}/Messages.json",
+                data={"Body": message, "From": self.twilio_from, "To": self.twilio_to},
+                auth=(self.twilio_sid, self.twilio_token)
+            )
+        except Exception as e:
+            logging.warning(f"SMS notification failed: {e}")
+
+    def notify(self, message: str):
+        # Fire-and-forget: status updates should never serialize the pipeline.
+        task = asyncio.create_task(self.send_sms(message))
+        self._sms_tasks.add(task)
+        task.add_done_callback(self._sms_tasks.discard)
+
+    async def drain_notifications(self):
+        # Let pending SMS sends finish before the caller's loop goes away,
+        # otherwise the final notifications are silently dropped.
+        if self._sms_tasks:
+            await asyncio.gather(*self._sms_tasks, return_exceptions=True)
 
     async def gather_requirements(self, user_query: str):
-        await self.send_sms("Gathering requirements...")
+        self.notify("Gathering requirements...")
         self.requirements = await self.model.generate_requirements(user_query)
         self.project_name = self.requirements.get("app_name", "NewApp")
         logging.info(f"Requirements gathered: {json.dumps(self.requirements, indent=2)}")
-        await self.send_sms(f"Requirements gathered for {self.project_name}")
+        self.notify(f"Requirements gathered for {self.project_name}")
         return self.requirements
 
     def generate_search_queries(self):
@@ -45,22 +80,28 @@ class AppBuilderOrchestrator:
         queries = []
         for feature in features:
             frontend = self.requirements.get('frontend', {}).get('framework', 'React')
-            queries.append(f"Best practices for implementing {feature} in {frontend}")
+            queries.append(make_search_query(feature, frontend))
         return queries
 
     async def perform_search(self, queries: List[str]):
-        await self.send_sms("Performing external searches...")
-        for query in queries:
-            results = await asyncio.get_event_loop().run_in_executor(None, self.search.run, query)
+        self.notify("Performing external searches...")
+        # The searches are independent network calls; fire them all at once.
+        loop = asyncio.get_event_loop()
+        results_list = await asyncio.gather(
+            *[loop.run_in_executor(None, self.search.run, query) for query in queries]
+        )
+        all_docs = []
+        for query, results in zip(queries, results_list):
             top_docs = [r['snippet'] for r in results[:3]]
-            # Add to RAG vector store
-            await add_resources_to_store(top_docs)
             self.search_results[query] = top_docs
+            all_docs.extend(top_docs)
             logging.info(f"Search results for '{query}': {top_docs}")
-        await self.send_sms("Search completed and indexed.")
+        # Add to RAG vector store in one batched call
+        await add_resources_to_store(all_docs)
+        self.notify("Search completed and indexed.")
 
     async def create_project_structure(self):
-        await self.send_sms("Creating project structure...")
+        self.notify("Creating project structure...")
         directories = [
             f"{self.project_name}/frontend",
             f"{self.project_name}/backend",
@@ -72,35 +113,70 @@ class AppBuilderOrchestrator:
         for directory in directories:
             os.makedirs(directory, exist_ok=True)
             logging.info(f"Created directory: {directory}")
-        await self.send_sms("Project structure created.")
+        self.notify("Project structure created.")
+
+    def _spec_hash(self) -> str:
+        return hashlib.sha256(json.dumps(self.requirements, sort_keys=True).encode()).hexdigest()
+
+    def _generated_files(self):
+        return {
+            "App.js": f"{self.project_name}/frontend/App.js",
+            "app.py": f"{self.project_name}/backend/app.py",
+            "App.swift": f"{self.project_name}/ios/App.swift"
+        }
+
+    def _restore_cached_code(self) -> bool:
+        cache_dir = os.path.join(CODE_CACHE_DIR, self._spec_hash())
+        files = self._generated_files()
+        if not all(os.path.exists(os.path.join(cache_dir, name)) for name in files):
+            return False
+        for name, dest in files.items():
+            shutil.copy(os.path.join(cache_dir, name), dest)
+        return True
+
+    def _save_code_cache(self):
+        cache_dir = os.path.join(CODE_CACHE_DIR, self._spec_hash())
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, src in self._generated_files().items():
+            if os.path.exists(src):
+                shutil.copy(src, os.path.join(cache_dir, name))
 
     async def generate_code(self):
-        await self.send_sms("Generating code...")
-        await self.generate_frontend_code()
-        await self.generate_backend_code()
-        await self.generate_ios_code()
-        await self.send_sms("Code generation complete.")
+        self.notify("Generating code...")
+        if self._restore_cached_code():
+            logging.info("Requirements unchanged; reusing cached generated code.")
+            self.notify("Reused cached code.")
+            return
+        # The three generations are independent; run them concurrently and
+        # let the model wrapper decide how many fit in flight at once.
+        await asyncio.gather(
+            self.generate_frontend_code(),
+            self.generate_backend_code(),
+            self.generate_ios_code()
+        )
+        self.notify("Code generation complete.")
+
+    async def _stream_code_to_file(self, language: str, path: str):
+        # Write tokens to disk as they arrive instead of buffering the whole
+        # completion in memory first.
+        async with aiofiles.open(path, "w") as f:
+            async for chunk in self.model.generate_code_stream(language, self.requirements):
+                await f.write(chunk)
 
     async def generate_frontend_code(self):
-        react_code = await self.model.generate_code("React", self.requirements)
-        with open(f"{self.project_name}/frontend/App.js", "w") as f:
-            f.write(react_code)
+        await self._stream_code_to_file("React", f"{self.project_name}/frontend/App.js")
         logging.info("Generated React frontend code.")
 
     async def generate_backend_code(self):
-        backend_code = await self.model.generate_code("Python", self.requirements)
-        with open(f"{self.project_name}/backend/app.py", "w") as f:
-            f.write(backend_code)
+        await self._stream_code_to_file("Python", f"{self.project_name}/backend/app.py")
         logging.info("Generated Python backend code.")
 
     async def generate_ios_code(self):
-        ios_code = await self.model.generate_code("SwiftUI", self.requirements)
-        with open(f"{self.project_name}/ios/App.swift", "w") as f:
-            f.write(ios_code)
+        await self._stream_code_to_file("SwiftUI", f"{self.project_name}/ios/App.swift")
         logging.info("Generated SwiftUI iOS app code.")
 
     async def lint_and_validate(self):
-        await self.send_sms("Running linters...")
+        self.notify("Running linters...")
         lint_commands = [
             ["black", f"{self.project_name}/backend"],
             ["pylint", f"{self.project_name}/backend/app.py"],
@@ -108,27 +184,40 @@ class AppBuilderOrchestrator:
             ["swiftlint", f"{self.project_name}/ios"]
         ]
 
-        for cmd in lint_commands:
-            try:
-                result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                logging.info(f"Linting successful: {' '.join(cmd)}")
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Linting failed: {' '.join(cmd)}\nError: {e.stderr.decode()}")
-                raise e
-        await self.send_sms("Linting completed.")
+        # The linters touch disjoint directories, so run them concurrently
+        # and report every failure instead of stopping at the first one. A
+        # missing linter binary raises FileNotFoundError; return_exceptions
+        # keeps that from aborting the gather and orphaning the other tasks.
+        results = await asyncio.gather(
+            *[self.run_subprocess(cmd) for cmd in lint_commands],
+            return_exceptions=True
+        )
+        failed = []
+        for cmd, result in zip(lint_commands, results):
+            if isinstance(result, Exception):
+                logging.error(f"Linting errored: {' '.join(cmd)}\nError: {result}")
+                failed.append(' '.join(cmd))
+            elif not result:
+                failed.append(' '.join(cmd))
+        if failed:
+            raise RuntimeError(f"Linting failed for: {', '.join(failed)}")
+        self.notify("Linting completed.")
 
     async def run_tests(self):
-        await self.send_sms("Running tests...")
-        backend_result = await self.run_subprocess(["pytest", f"{self.project_name}/backend/tests"], cwd=f"{self.project_name}/backend")
-        frontend_result = await self.run_subprocess(["npm", "test"], cwd=f"{self.project_name}/frontend")
-        ios_result = await self.run_subprocess(["xcodebuild", "test"], cwd=f"{self.project_name}/ios")
+        self.notify("Running tests...")
+        # Backend, frontend, and iOS test suites are independent.
+        backend_result, frontend_result, ios_result = await asyncio.gather(
+            self.run_subprocess(["pytest", f"{self.project_name}/backend/tests"], cwd=f"{self.project_name}/backend"),
+            self.run_subprocess(["npm", "test"], cwd=f"{self.project_name}/frontend"),
+            self.run_subprocess(["xcodebuild", "test"], cwd=f"{self.project_name}/ios")
+        )
         all_passed = backend_result and frontend_result and ios_result
         if all_passed:
             logging.info("All tests passed successfully!")
-            await self.send_sms("All tests passed successfully!")
+            self.notify("All tests passed successfully!")
         else:
             logging.warning("Some tests failed.")
-            await self.send_sms("Some tests failed.")
+            self.notify("Some tests failed.")
         return all_passed
 
     async def run_subprocess(self, cmd, cwd=None):
@@ -147,14 +236,14 @@ class AppBuilderOrchestrator:
             return False
 
     async def fix_errors(self):
-        await self.send_sms("Attempting to fix errors...")
+        self.notify("Attempting to fix errors...")
         fixed = await self.model.fix_code(self.project_name)
         if fixed:
             logging.info("Errors fixed successfully.")
-            await self.send_sms("Errors fixed, re-testing...")
+            self.notify("Errors fixed, re-testing...")
         else:
             logging.warning("No fixes were applied.")
-            await self.send_sms("No fixes applied.")
+            self.notify("No fixes applied.")
 
     async def iterate_until_success(self):
         for attempt in range(1, self.max_iterations + 1):
@@ -165,46 +254,58 @@ class AppBuilderOrchestrator:
                 logging.info("Fixing issues and retrying...")
                 await self.fix_errors()
         logging.error("Maximum attempts reached. Tests still failing.")
-        await self.send_sms("Max attempts reached, tests failing.")
+        self.notify("Max attempts reached, tests failing.")
         return False
 
     async def deploy(self):
-        await self.send_sms("Deploying application...")
+        self.notify("Deploying application...")
         try:
-            await self.deploy_backend()
-            await self.deploy_frontend()
-            await self.deploy_ios()
+            # The three deploy targets are independent; run them together.
+            await asyncio.gather(
+                self.deploy_backend(),
+                self.deploy_frontend(),
+                self.deploy_ios()
+            )
             logging.info("All components deployed successfully.")
-            await self.send_sms("Deployment successful.")
+            self.notify("Deployment successful.")
         except Exception as e:
             logging.error(f"Deployment failed: {e}")
-            await self.send_sms("Deployment failed.")
+            self.notify("Deployment failed.")
             raise e
 
+    async def _run_deploy_step(self, cmd, cwd=None):
+        if not await self.run_subprocess(cmd, cwd=cwd):
+            raise RuntimeError(f"Deploy step failed: {' '.join(cmd)}")
+
     async def deploy_backend(self):
-        subprocess.run(["docker-compose", "build"], cwd=self.project_name, check=True)
-        subprocess.run(["docker-compose", "push"], cwd=self.project_name, check=True)
-        subprocess.run(["terraform", "apply", "-auto-approve"], cwd=f"{self.project_name}/configs/terraform", check=True)
+        await self._run_deploy_step(["docker-compose", "build"], cwd=self.project_name)
+        await self._run_deploy_step(["docker-compose", "push"], cwd=self.project_name)
+        await self._run_deploy_step(["terraform", "apply", "-auto-approve"], cwd=f"{self.project_name}/configs/terraform")
         logging.info("Backend deployed.")
 
     async def deploy_frontend(self):
-        subprocess.run(["vercel", "--prod"], cwd=f"{self.project_name}/frontend", check=True)
+        await self._run_deploy_step(["vercel", "--prod"], cwd=f"{self.project_name}/frontend")
         logging.info("Frontend deployed.")
 
     async def deploy_ios(self):
-        subprocess.run(["fastlane", "release"], cwd=f"{self.project_name}/ios", check=True)
+        await self._run_deploy_step(["fastlane", "release"], cwd=f"{self.project_name}/ios")
         logging.info("iOS app deployed.")
 
     async def build_app(self, user_query: str):
-        await self.gather_requirements(user_query)
-        search_queries = self.generate_search_queries()
-        if search_queries:
-            await self.perform_search(search_queries)
-        await self.create_project_structure()
-        await self.generate_code()
-        await self.lint_and_validate()
-        success = await self.iterate_until_success()
-        if success:
-            await self.deploy()
-        else:
-            logging.warning("Skipping deployment due to test failures.")
\ No newline at end of file
+        try:
+            await self.gather_requirements(user_query)
+            search_queries = self.generate_search_queries()
+            if search_queries:
+                await self.perform_search(search_queries)
+            await self.create_project_structure()
+            await self.generate_code()
+            await self.lint_and_validate()
+            # Only cache code that made it through lint.
+            self._save_code_cache()
+            success = await self.iterate_until_success()
+            if success:
+                await self.deploy()
+            else:
+                logging.warning("Skipping deployment due to test failures.")
+        finally:
+            await self.drain_notifications()
\ No newline at end of file
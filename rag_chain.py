@@ -2,7 +2,18 @@
 
 import asyncio
 from typing import List
-from model_integration.vectorstore import search_vectorstore, add_document_to_store
+from model_integration.vectorstore import (
+    search_vectorstore,
+    search_vectorstore_composed,
+    add_documents_to_store,
+)
+
+# Template shared with the orchestrator's search-query generation; keeping
+# the pieces separate lets the vector search compose pre-embedded parts.
+SEARCH_QUERY_PREFIX = "Best practices for implementing "
+
+def make_search_query(feature: str, frontend: str) -> str:
+    return f"{SEARCH_QUERY_PREFIX}{feature} in {frontend}"
 
 async def rag_search_and_store(query: str):
     # Perform vector store search
@@ -11,6 +22,13 @@ async def rag_search_and_store(query: str):
     combined = "\n".join([doc.page_content for doc in results])
     return combined
 
+async def rag_search_templated(feature: str, frontend: str):
+    # Compose the query vector from cached component embeddings instead of
+    # encoding the full templated string each time.
+    results = search_vectorstore_composed((SEARCH_QUERY_PREFIX, feature, f" in {frontend}"), k=3)
+    combined = "\n".join([doc.page_content for doc in results])
+    return combined
+
 async def add_resources_to_store(resources: List[str]):
-    for res in resources:
-        add_document_to_store(res)
\ No newline at end of file
+    # One batched embedding call and one persist for the whole list.
+    await asyncio.get_event_loop().run_in_executor(None, add_documents_to_store, resources)
\ No newline at end of file
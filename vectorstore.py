@@ -1,34 +1,206 @@
 # project_root/model_integration/vectorstore.py
 
+import atexit
 import os
 import pickle
+import threading
+import uuid
+from functools import lru_cache
+from typing import List, Tuple
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
+from model_integration import embedding_cache
+from model_integration.embeddings import get_embeddings
 
 # This sets up a vector store for RAG. On first run, create it if not exists.
 # On subsequent runs, load the existing store.
+# Persistence uses FAISS's native save_local/load_local (index binary +
+# docstore) rather than pickling the whole store, and writes are batched:
+# texts accumulate in _pending_texts and are embedded/persisted together
+# once _FLUSH_THRESHOLD is reached or at interpreter exit.
 
-VECTOR_STORE_PATH = "project_root/model_integration/faiss_store.pkl"
+VECTOR_STORE_DIR = "project_root/model_integration/faiss_store"
+
+_FLUSH_THRESHOLD = 64
+
+# HNSW parameters: M=32 neighbours per node, efConstruction/efSearch tuned
+# for recall at the store sizes this app reaches (tens of thousands of
+# search snippets). Search is O(log N) instead of a brute-force flat scan.
+_HNSW_M = 32
+_HNSW_EF_CONSTRUCTION = 200
+_HNSW_EF_SEARCH = 64
+
+# "hnsw" (default) trades memory for sub-linear search; "sq8" stores int8
+# scalar-quantized codes, 4x smaller than fp32 and scanned at a quarter of
+# the memory bandwidth, for deployments where the store must stay small.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+
+# Opt-in memory-mapped loading for read-only serving. faiss cannot mmap
+# every index type (notably not the default HNSW), and an mmapped index
+# must never be mutated — adds plus a save_local over the live mapping
+# mean SIGBUS or corruption — so this stays off unless a deployment that
+# only queries an already-built store enables it.
+VECTOR_STORE_MMAP = os.getenv("VECTOR_STORE_MMAP", "0") == "1"
+
+# Keep the store in memory between calls; reloading it from disk on every
+# add/search is expensive once the index grows.
+_vectorstore = None
+_vectorstore_lock = threading.RLock()
+_pending_texts: List[str] = []
 
 def get_vectorstore():
-    if os.path.exists(VECTOR_STORE_PATH):
-        with open(VECTOR_STORE_PATH, "rb") as f:
-            vs = pickle.load(f)
-        return vs
+    global _vectorstore
+    with _vectorstore_lock:
+        if _vectorstore is not None:
+            return _vectorstore
+        if os.path.isdir(VECTOR_STORE_DIR):
+            if VECTOR_STORE_MMAP:
+                _vectorstore = _load_store_mmap()
+            else:
+                _vectorstore = FAISS.load_local(
+                    VECTOR_STORE_DIR, get_embeddings(),
+                    allow_dangerous_deserialization=True,
+                )
+            if hasattr(_vectorstore.index, "hnsw"):
+                _vectorstore.index.hnsw.efSearch = _HNSW_EF_SEARCH
+        else:
+            _vectorstore = _new_store()
+            _vectorstore.save_local(VECTOR_STORE_DIR)
+        return _vectorstore
+
+def _load_store_mmap():
+    # Memory-map the index binary so cold start doesn't read the whole
+    # index into RAM up front; the OS pages in only what queries touch.
+    # Read-only: add_documents_to_store refuses to write to a store loaded
+    # this way. The docstore sidecar (index.pkl from save_local) is small
+    # and loads normally.
+    index = faiss.read_index(
+        os.path.join(VECTOR_STORE_DIR, "index.faiss"),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    )
+    with open(os.path.join(VECTOR_STORE_DIR, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=get_embeddings().embed_query,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+def _new_store():
+    embeddings = get_embeddings()
+    dim = len(embeddings.embed_query("dimension probe"))
+    if VECTOR_INDEX_TYPE == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
     else:
-        embeddings = HuggingFaceEmbeddings()
-        vs = FAISS.from_texts(["initial text"], embeddings)
-        with open(VECTOR_STORE_PATH, "wb") as f:
-            pickle.dump(vs, f)
-        return vs
+        index = faiss.IndexHNSWFlat(dim, _HNSW_M)
+        index.hnsw.efConstruction = _HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = _HNSW_EF_SEARCH
+    return FAISS(
+        embedding_function=embeddings.embed_query,
+        index=index,
+        docstore=InMemoryDocstore({}),
+        index_to_docstore_id={},
+    )
+
+def flush_pending_texts():
+    # Embed and persist whatever has accumulated. Called when the batch
+    # threshold is hit and at exit for the remainder.
+    with _vectorstore_lock:
+        if not _pending_texts:
+            return
+        vs = get_vectorstore()
+        _add_texts_cached(vs, _pending_texts)
+        _pending_texts.clear()
+        vs.save_local(VECTOR_STORE_DIR)
+
+def _add_texts_cached(vs, texts: List[str]):
+    # Run the encoder only on texts whose embedding is not already in the
+    # on-disk cache; cache hits go straight into the index. Embeddings are
+    # assembled in-place into one contiguous float32 (B, d) array so FAISS
+    # ingests it without the list-of-lists round trip and extra copy.
+    hashes = [embedding_cache.text_hash(t) for t in texts]
+    arr = np.empty((len(texts), vs.index.d), dtype=np.float32)
+    miss_idx = []
+    for i, h in enumerate(hashes):
+        vec = embedding_cache.get(h)
+        if vec is None:
+            miss_idx.append(i)
+        else:
+            arr[i] = vec
+    if miss_idx:
+        # Go straight to the SentenceTransformer API: it returns a
+        # contiguous float32 array rather than List[List[float]].
+        miss_vecs = get_embeddings().client.encode(
+            [texts[i] for i in miss_idx],
+            batch_size=64, convert_to_numpy=True, normalize_embeddings=True,
+        )
+        for i, row in zip(miss_idx, miss_vecs):
+            arr[i] = row
+            embedding_cache.put(hashes[i], row)
+    _add_vectors(vs, texts, arr)
+
+def _add_vectors(vs, texts: List[str], arr: np.ndarray):
+    # Append to the FAISS index and docstore directly; vs.add_embeddings
+    # would re-copy the batch into a fresh array first.
+    if not vs.index.is_trained:
+        # Scalar quantizers need per-dimension ranges; the first batch is
+        # representative enough for normalized sentence embeddings.
+        vs.index.train(arr)
+    starting = vs.index.ntotal
+    vs.index.add(arr)
+    for offset, text in enumerate(texts):
+        doc_id = str(uuid.uuid4())
+        vs.docstore.add({doc_id: Document(page_content=text)})
+        vs.index_to_docstore_id[starting + offset] = doc_id
+
+atexit.register(flush_pending_texts)
+
+def add_documents_to_store(texts: List[str]):
+    if not texts:
+        return
+    if VECTOR_STORE_MMAP:
+        raise RuntimeError(
+            "Vector store was memory-mapped read-only (VECTOR_STORE_MMAP); "
+            "writes would corrupt the live mapping."
+        )
+    with _vectorstore_lock:
+        _pending_texts.extend(texts)
+        if len(_pending_texts) >= _FLUSH_THRESHOLD:
+            flush_pending_texts()
 
 def add_document_to_store(text: str):
-    vs = get_vectorstore()
-    embeddings = HuggingFaceEmbeddings()
-    new_vs = vs.add_texts([text], embeddings)
-    with open(VECTOR_STORE_PATH, "wb") as f:
-        pickle.dump(new_vs, f)
+    add_documents_to_store([text])
+
+@lru_cache(maxsize=1024)
+def _embed_query(text: str) -> Tuple[float, ...]:
+    # Query strings recur (generate_search_queries emits templated text),
+    # so hot queries become a dict lookup instead of an encoder pass.
+    return tuple(get_embeddings().embed_query(text))
 
 def search_vectorstore(query: str, k=3):
-    vs = get_vectorstore()
-    return vs.similarity_search(query, k=k)
\ No newline at end of file
+    with _vectorstore_lock:
+        # Make buffered texts visible to the search before querying.
+        flush_pending_texts()
+        vs = get_vectorstore()
+    return vs.similarity_search_by_vector(list(_embed_query(query)), k=k)
+
+def search_vectorstore_composed(parts: Tuple[str, ...], k=3):
+    # Templated queries share components ("Best practices for implementing ",
+    # the feature, the frontend) across features and builds. Each component
+    # is embedded once through the query LRU and the full query vector is
+    # approximated by mean-pooling — close enough to the true encoding for
+    # short normalized sentence embeddings, and it skips the encoder
+    # entirely once the components are cached.
+    vecs = np.stack([np.asarray(_embed_query(p), dtype=np.float32) for p in parts])
+    vec = vecs.mean(axis=0)
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    with _vectorstore_lock:
+        flush_pending_texts()
+        vs = get_vectorstore()
+    return vs.similarity_search_by_vector(vec.tolist(), k=k)